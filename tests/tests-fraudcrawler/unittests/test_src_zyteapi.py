@@ -0,0 +1,396 @@
+import asyncio
+import threading
+
+from aiohttp import web
+import orjson
+import pytest
+
+from veanu.fraudcrawler.src.chaos import ChaosMiddleware, FaultType
+from veanu.fraudcrawler.src.circuit_breaker import CircuitBreaker, CircuitState, Permit
+from veanu.fraudcrawler.src.zyteapi import ZyteAPIClient
+
+_URLS = [f"https://www.example.ch/product/{i}" for i in range(20)]
+
+
+async def _fake_post(url: str, timeout=None) -> dict:
+    return {"product": {"name": url}}
+
+
+@pytest.fixture
+def zyte_endpoint():
+    """Serves a fake Zyte API on a local port from an event loop on a separate thread."""
+
+    async def extract(request: web.Request) -> web.Response:
+        data = await request.json()
+        return web.json_response({"product": {"name": data["url"]}})
+
+    loop = asyncio.new_event_loop()
+    app = web.Application()
+    app.router.add_post("/v1/extract", extract)
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]
+
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{port}/v1/extract"
+
+    asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+def _chaos_client(
+    seed: int, rules: dict, max_retries: int = 3
+) -> tuple[ZyteAPIClient, ChaosMiddleware]:
+    client = ZyteAPIClient(api_key="key", max_retries=max_retries, retry_delay=0)
+    chaos = ChaosMiddleware(seed=seed, rules=rules)
+    client._aiohttp_post = chaos.wrap(_fake_post)
+    return client, chaos
+
+
+def test_chaos_middleware_is_reproducible():
+    rules = {FaultType.HTTP_5XX: 0.3, FaultType.NETWORK_TIMEOUT: 0.2}
+    draws = []
+    for _ in range(2):
+        chaos = ChaosMiddleware(seed=1, rules=rules)
+        draws.append([chaos._draw() for _ in range(20)])
+    assert draws[0] == draws[1]
+    assert len(set(draws[0])) > 1
+
+
+def test_chaos_middleware_invalid_rules():
+    with pytest.raises(ValueError):
+        ChaosMiddleware(
+            seed=1, rules={FaultType.HTTP_5XX: 0.6, FaultType.HTTP_429: 0.6}
+        )
+
+
+def test_get_details_recovers_from_transient_faults():
+    rules = {FaultType.HTTP_5XX: 0.2, FaultType.NETWORK_TIMEOUT: 0.1}
+    results = []
+    for _ in range(2):
+        client, chaos = _chaos_client(seed=42, rules=rules, max_retries=5)
+        products = client.get_details(urls=_URLS)
+        results.append([prod["url"] for prod in products])
+
+    assert results[0] == results[1]
+    assert results[0] == _URLS
+    assert chaos.injected[FaultType.HTTP_5XX] > 0
+
+
+def test_get_details_keeps_order_of_urls():
+    client, _ = _chaos_client(seed=0, rules={})
+    products = client.get_details(urls=_URLS)
+    assert [prod["url"] for prod in products] == _URLS
+
+
+def test_get_details_fetches_duplicate_urls_once():
+    calls = []
+
+    async def counting_post(url: str, timeout=None) -> dict:
+        calls.append(url)
+        return await _fake_post(url=url)
+
+    client = ZyteAPIClient(api_key="key", retry_delay=0)
+    client._aiohttp_post = counting_post
+    urls = _URLS[:3] + _URLS[:2] + _URLS[3:5]
+    products = client.get_details(urls=urls)
+
+    assert [prod["url"] for prod in products] == urls
+    assert sorted(calls) == sorted(_URLS[:5])
+    # Duplicates are independent copies (downstream steps modify the products in place)
+    assert products[3] == products[0] and products[3] is not products[0]
+    assert products[3]["product"] is not products[0]["product"]
+
+
+def test_circuit_breaker_opens_on_persistent_faults():
+    client, chaos = _chaos_client(
+        seed=0, rules={FaultType.HTTP_429: 1.0}, max_retries=3
+    )
+    products = client.get_details(urls=_URLS)
+
+    assert products == []
+    assert client._breaker.state == CircuitState.OPEN
+    # The breaker opens after 5 failures, the remaining URLs are skipped without calling the API
+    assert chaos.injected[FaultType.HTTP_429] == 5
+
+
+def test_cancelled_half_open_trial_releases_circuit_breaker():
+    client = ZyteAPIClient(api_key="key", retry_delay=0)
+    client._breaker = CircuitBreaker(name="test", error_threshold=1, recovery_seconds=0)
+    client._breaker.record_failure()
+    assert client._breaker.state == CircuitState.OPEN
+
+    async def hanging_post(url: str, timeout=None) -> dict:
+        await asyncio.Event().wait()
+
+    client._aiohttp_post = hanging_post
+
+    async def run():
+        task = asyncio.create_task(client._async_get_details_for_url(url=_URLS[0]))
+        await asyncio.sleep(0.01)
+        assert client._breaker.state == CircuitState.HALF_OPEN
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert client._breaker.allow()
+
+
+def test_non_dict_response_records_a_single_failure():
+    client = ZyteAPIClient(api_key="key", max_retries=1, retry_delay=0)
+
+    async def list_post(url: str, timeout=None) -> list:
+        return []
+
+    client._aiohttp_post = list_post
+    product = asyncio.run(client._async_get_details_for_url(url=_URLS[0]))
+
+    assert product is None
+    assert client._breaker._failures == 1
+
+
+def test_deadline_bounds_attempt_timeout_and_retries():
+    client = ZyteAPIClient(api_key="key", max_retries=3, retry_delay=0)
+    client._total_timeout = 0.5
+    slow_delay = 1.0
+    timeouts = []
+
+    async def slow_post(url: str, timeout=None) -> dict:
+        # Stands in for aiohttp, which aborts the request after `timeout.total` seconds
+        timeouts.append(timeout.total)
+        await asyncio.wait_for(asyncio.sleep(slow_delay), timeout=timeout.total)
+        return await _fake_post(url=url)
+
+    client._aiohttp_post = slow_post
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        product = await client._async_get_details_for_url(url=_URLS[0])
+        return product, loop.time() - start
+
+    product, elapsed = asyncio.run(run())
+
+    # The first attempt gets the remaining budget instead of `_requests_timeout`
+    assert 0.4 < timeouts[0] <= client._total_timeout
+    assert all(0.1 <= t <= client._total_timeout for t in timeouts)
+    # The slow response never completes and the retries stop at the deadline (plus at most the 0.1s floor)
+    assert product is None
+    assert elapsed < slow_delay
+
+
+def test_slow_response_is_bounded_by_timeout():
+    client = ZyteAPIClient(api_key="key", max_retries=3, retry_delay=0)
+    client._total_timeout = 0.5
+    chaos = ChaosMiddleware(
+        seed=0, rules={FaultType.SLOW_RESPONSE: 1.0}, slow_delay=2.0
+    )
+    client._aiohttp_post = chaos.wrap(_fake_post)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        product = await client._async_get_details_for_url(url=_URLS[0])
+        return product, loop.time() - start
+
+    product, elapsed = asyncio.run(run())
+
+    assert product is None
+    assert chaos.injected[FaultType.SLOW_RESPONSE] >= 1
+    assert elapsed < 1.0
+
+
+def test_get_details_inside_running_loop_uses_its_own_session(zyte_endpoint):
+    client = ZyteAPIClient(api_key="key", retry_delay=0)
+    client._endpoint = zyte_endpoint
+
+    async def run():
+        # Creates the session of the caller's event loop
+        products = await client.fetch_all(urls=_URLS[:3])
+        assert [prod["url"] for prod in products] == _URLS[:3]
+        session = client._sessions[asyncio.get_running_loop()]
+
+        # Runs on a dedicated thread's event loop
+        products = client.get_details(urls=_URLS[3:6])
+        assert [prod["url"] for prod in products] == _URLS[3:6]
+        assert not session.closed
+
+        await client.close()
+        assert session.closed
+
+    asyncio.run(run())
+    assert client._breaker._failures == 0
+    assert client._sessions == {}
+
+
+def test_waiting_for_bulkhead_counts_against_deadline():
+    client = ZyteAPIClient(
+        api_key="key", max_retries=1, retry_delay=0, async_limit_per_host=1
+    )
+    client._total_timeout = 0.5
+    calls = []
+
+    async def slow_post(url: str, timeout=None) -> dict:
+        # Stands in for aiohttp, which aborts the request after `timeout.total` seconds
+        calls.append((url, timeout.total))
+        await asyncio.wait_for(asyncio.sleep(0.3), timeout=timeout.total)
+        return await _fake_post(url=url)
+
+    client._aiohttp_post = slow_post
+
+    async def run():
+        return await asyncio.gather(
+            *(client._async_get_details_for_url(url=url) for url in _URLS[:3])
+        )
+
+    products = asyncio.run(run())
+
+    assert products[0]["url"] == _URLS[0]
+    assert products[1:] == [None, None]
+    # The second URL waited ~0.3s for the only slot, its request only gets the rest of the budget
+    assert [url for url, _ in calls] == _URLS[:2]
+    assert calls[1][1] < 0.25
+
+
+def test_fetch_all_holds_no_slot_during_backoff():
+    client = ZyteAPIClient(
+        api_key="key", max_retries=2, retry_delay=0, async_limit_per_host=1
+    )
+    chaos = ChaosMiddleware(seed=0, rules={}, retry_after=0.3)
+    calls = []
+
+    async def post(url: str, timeout=None) -> dict:
+        calls.append((url, asyncio.get_running_loop().time()))
+        if len(calls) == 1:
+            raise chaos._response_error(status=429, message="Too Many Requests")
+        return await _fake_post(url=url)
+
+    client._aiohttp_post = post
+
+    async def run():
+        start = asyncio.get_running_loop().time()
+        products = await client.fetch_all(urls=_URLS[:2])
+        return products, start
+
+    products, start = asyncio.run(run())
+
+    assert [prod["url"] for prod in products] == _URLS[:2]
+    # The second URL uses the only slot while the first one sleeps for its Retry-After
+    assert [url for url, _ in calls] == [_URLS[0], _URLS[1], _URLS[0]]
+    assert calls[1][1] - start < 0.1
+    assert calls[2][1] - start >= 0.3
+
+
+def test_cancelled_non_trial_call_keeps_half_open_trial():
+    client = ZyteAPIClient(api_key="key", retry_delay=0)
+    breaker = CircuitBreaker(name="test", error_threshold=1, recovery_seconds=0)
+    client._breaker = breaker
+
+    async def hanging_post(url: str, timeout=None) -> dict:
+        await asyncio.Event().wait()
+
+    client._aiohttp_post = hanging_post
+
+    async def run():
+        # A call started while the circuit was closed
+        task = asyncio.create_task(client._async_get_details_for_url(url=_URLS[0]))
+        await asyncio.sleep(0.01)
+
+        # Meanwhile the circuit opens and another caller takes the half-open trial
+        breaker.record_failure()
+        assert breaker.allow() is Permit.TRIAL
+
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert breaker.state == CircuitState.HALF_OPEN
+    assert breaker.allow() is Permit.DENIED
+
+
+@pytest.mark.parametrize("status, attempts", [(400, 1), (403, 1), (520, 3)])
+def test_retries_only_retryable_status_codes(status, attempts):
+    client = ZyteAPIClient(api_key="key", max_retries=3, retry_delay=0)
+    chaos = ChaosMiddleware(seed=0, rules={})
+    calls = []
+
+    async def failing_post(url: str, timeout=None) -> dict:
+        calls.append(url)
+        raise chaos._response_error(status=status, message="error")
+
+    client._aiohttp_post = chaos.wrap(failing_post)
+    product = asyncio.run(client._async_get_details_for_url(url=_URLS[0]))
+
+    assert product is None
+    assert len(calls) == attempts
+    # A client error means the API is reachable, it does not count against the circuit breaker
+    assert client._breaker._failures == (0 if status < 500 else attempts)
+
+
+def test_backoff_delay_is_capped(monkeypatch):
+    client = ZyteAPIClient(api_key="key", retry_delay=5)
+    # Always draws the upper bound of the jitter interval
+    monkeypatch.setattr("veanu.fraudcrawler.src.zyteapi.random.uniform", lambda a, b: b)
+
+    assert client._backoff_delay(attempt=0) == 5
+    assert client._backoff_delay(attempt=2) == 20
+    assert client._backoff_delay(attempt=10) == client._retry_delay_cap
+
+
+def test_backoff_delay_respects_retry_after(monkeypatch):
+    client = ZyteAPIClient(api_key="key", retry_delay=5)
+    # Always draws the lower bound of the jitter interval
+    monkeypatch.setattr("veanu.fraudcrawler.src.zyteapi.random.uniform", lambda a, b: a)
+
+    assert client._backoff_delay(attempt=0) == 0
+    assert client._backoff_delay(attempt=0, retry_after="0.3") == 0.3
+    # HTTP dates are not supported and ignored
+    assert (
+        client._backoff_delay(attempt=0, retry_after="Wed, 21 Oct 2026 07:28:00 GMT")
+        == 0
+    )
+
+
+def test_retry_waits_for_retry_after():
+    client = ZyteAPIClient(api_key="key", max_retries=2, retry_delay=0)
+    chaos = ChaosMiddleware(seed=1, rules={FaultType.HTTP_429: 0.5}, retry_after=0.3)
+    calls = []
+
+    async def post(url: str, timeout=None) -> dict:
+        calls.append(asyncio.get_running_loop().time())
+        return await _fake_post(url=url)
+
+    # Seed 1 draws a 429 for the first call and lets the second one through
+    client._aiohttp_post = chaos.wrap(post)
+
+    async def run():
+        start = asyncio.get_running_loop().time()
+        product = await client._async_get_details_for_url(url=_URLS[0])
+        return product, asyncio.get_running_loop().time() - start
+
+    product, elapsed = asyncio.run(run())
+
+    assert product["url"] == _URLS[0]
+    assert chaos.injected[FaultType.HTTP_429] == 1
+    assert len(calls) == 1
+    assert elapsed >= 0.3
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        _URLS[0],
+        'https://www.example.ch/search?q="sildenafil"&a=1\\2',
+        "https://www.exämple.ch/produkt/größe/日本",
+    ],
+)
+def test_body_prefix_serializes_config_and_url(url):
+    body = ZyteAPIClient._body_prefix + orjson.dumps(url) + b"}"
+    assert orjson.loads(body) == {**ZyteAPIClient._config, "url": url}
@@ -1,5 +1,6 @@
 import logging
 import os
+from pathlib import Path
 
 from dotenv import load_dotenv
 
@@ -7,25 +8,34 @@ from veanu import LOG_FMT
 from veanu.fraudcrawler.settings import LOG_LEVEL
 from veanu.fraudcrawler.src.client import FraudCrawlerClient
 
-logging.basicConfig(
-    level=LOG_LEVEL.upper(), format=LOG_FMT, datefmt="%Y-%m-%d %H:%M:%S"
-)
 logger = logging.getLogger(__name__)
 
-# Load environment variables
-load_dotenv()
-_SERPAPI_KEY = os.getenv("SERPAPI_KEY")
-_ZYTEAPI_KEY = os.getenv("ZYTEAPI_KEY")
-_OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-
-# Instantiate the client
-client = FraudCrawlerClient(
-    serpapi_key=_SERPAPI_KEY,
-    zyteapi_key=_ZYTEAPI_KEY,
-    openai_api_key=_OPENAI_API_KEY,
-    location="Switzerland",
-)
-
-# Perform sequential search
-df = client.run("sildenafil", num_results=10)
-print(df.head())
+_ENV_FILE = Path(__file__).parent / ".env"
+
+
+def main():
+    logging.basicConfig(
+        level=LOG_LEVEL.upper(), format=LOG_FMT, datefmt="%Y-%m-%d %H:%M:%S"
+    )
+
+    # Load environment variables
+    load_dotenv(_ENV_FILE, override=False)
+    serpapi_key = os.getenv("SERPAPI_KEY")
+    zyteapi_key = os.getenv("ZYTEAPI_KEY")
+    openai_api_key = os.getenv("OPENAI_API_KEY")
+
+    # Instantiate the client
+    client = FraudCrawlerClient(
+        serpapi_key=serpapi_key,
+        zyteapi_key=zyteapi_key,
+        openai_api_key=openai_api_key,
+        location="Switzerland",
+    )
+
+    # Perform sequential search
+    df = client.run("sildenafil", num_results=10)
+    print(df.head())
+
+
+if __name__ == "__main__":
+    main()
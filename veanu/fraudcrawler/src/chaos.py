@@ -0,0 +1,118 @@
+"""Fault injection for the Zyte API calls.
+
+The :class:`ChaosMiddleware` wraps :meth:`ZyteAPIClient._aiohttp_post` and injects network timeouts, HTTP errors or
+slow responses according to seeded probabilities. This makes the retry, backoff and circuit breaker behaviour
+reproducible without calling the live API, e.g.:
+
+    client._aiohttp_post = ChaosMiddleware(seed=42, rules={FaultType.HTTP_5XX: 0.2}).wrap(client._aiohttp_post)
+"""
+
+import asyncio
+from enum import Enum
+from functools import wraps
+import logging
+import random
+from typing import Any, Awaitable, Callable, Dict
+
+import aiohttp
+from multidict import CIMultiDict, CIMultiDictProxy
+from yarl import URL
+
+from veanu.fraudcrawler.src.zyteapi import ZyteAPIClient
+
+logger = logging.getLogger(__name__)
+
+
+class FaultType(Enum):
+    NETWORK_TIMEOUT = "network_timeout"
+    HTTP_5XX = "http_5xx"
+    HTTP_429 = "http_429"
+    SLOW_RESPONSE = "slow_response"
+
+
+class ChaosMiddleware:
+    """Injects faults into an async request function with seeded, reproducible probabilities."""
+
+    def __init__(
+        self,
+        seed: int,
+        rules: Dict[FaultType, float],
+        slow_delay: float = 1.0,
+        retry_after: float | None = None,
+    ):
+        """Initializes the ChaosMiddleware.
+
+        Args:
+            seed: The seed of the random number generator.
+            rules: The probability of each fault type per call (the probabilities must sum up to at most 1).
+            slow_delay: The delay in seconds added by a `FaultType.SLOW_RESPONSE`, bounded by the `timeout` of the
+                call (default: 1.0).
+            retry_after: The `Retry-After` header value in seconds sent with `FaultType.HTTP_429` (default: None).
+        """
+        if sum(rules.values()) > 1:
+            raise ValueError("the fault probabilities must sum up to at most 1")
+        self._rng = random.Random(seed)  # nosec
+        self._rules = rules
+        self._slow_delay = slow_delay
+        self._retry_after = retry_after
+        self.injected = {ft: 0 for ft in FaultType}  # type: Dict[FaultType, int]
+
+    def _draw(self) -> FaultType | None:
+        """Draws the fault for the next call (`None` if the call goes through untouched)."""
+        r = self._rng.random()
+        cumulative = 0.0
+        for fault, prob in self._rules.items():
+            cumulative += prob
+            if r < cumulative:
+                return fault
+        return None
+
+    def _response_error(self, status: int, message: str) -> aiohttp.ClientResponseError:
+        url = URL(ZyteAPIClient._endpoint)
+        request_info = aiohttp.RequestInfo(
+            url=url,
+            method="POST",
+            headers=CIMultiDictProxy(CIMultiDict()),
+            real_url=url,
+        )
+        headers = CIMultiDict()
+        if status == 429 and self._retry_after is not None:
+            headers["Retry-After"] = str(self._retry_after)
+        return aiohttp.ClientResponseError(
+            request_info=request_info,
+            history=(),
+            status=status,
+            message=message,
+            headers=CIMultiDictProxy(headers),
+        )
+
+    def wrap(
+        self, func: Callable[..., Awaitable[Any]]
+    ) -> Callable[..., Awaitable[Any]]:
+        """Wraps an async request function with the fault injection."""
+
+        @wraps(func)
+        async def wrapped(*args, **kwargs) -> Any:
+            fault = self._draw()
+            if fault is not None:
+                self.injected[fault] += 1
+                logger.debug(f"injecting fault {fault.value}")
+
+            if fault == FaultType.NETWORK_TIMEOUT:
+                raise asyncio.TimeoutError("injected network timeout")
+            if fault == FaultType.HTTP_5XX:
+                raise self._response_error(status=503, message="Service Unavailable")
+            if fault == FaultType.HTTP_429:
+                raise self._response_error(status=429, message="Too Many Requests")
+            if fault == FaultType.SLOW_RESPONSE:
+                # Like aiohttp, the request is aborted once the timeout passed by the caller is exceeded
+                timeout = kwargs.get("timeout")
+                if timeout is not None and timeout.total:
+                    await asyncio.wait_for(
+                        asyncio.sleep(self._slow_delay), timeout=timeout.total
+                    )
+                else:
+                    await asyncio.sleep(self._slow_delay)
+            return await func(*args, **kwargs)
+
+        return wrapped
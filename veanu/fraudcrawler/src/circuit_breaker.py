@@ -0,0 +1,111 @@
+from enum import Enum
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitState(Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class Permit(Enum):
+    """The answer of :meth:`CircuitBreaker.allow` (falsy if the call is denied)."""
+
+    DENIED = "denied"
+    CALL = "call"
+    TRIAL = "trial"
+
+    def __bool__(self) -> bool:
+        return self is not Permit.DENIED
+
+
+class CircuitBreaker:
+    """A circuit breaker that stops calls to a failing provider and lets a single trial call through after a
+    recovery period.
+
+    The state transitions are CLOSED -> OPEN (after `error_threshold` consecutive failures) -> HALF_OPEN (after
+    `recovery_seconds`) -> CLOSED (trial call succeeded) or OPEN (trial call failed).
+    """
+
+    def __init__(
+        self, name: str, error_threshold: int = 5, recovery_seconds: float = 30
+    ):
+        """Initializes the CircuitBreaker.
+
+        Args:
+            name: The name of the protected provider (used for logging).
+            error_threshold: Number of consecutive failures before the circuit opens (default: 5).
+            recovery_seconds: Time in seconds before an open circuit lets a trial call through (default: 30).
+        """
+        self._name = name
+        self._error_threshold = error_threshold
+        self._recovery_seconds = recovery_seconds
+
+        # The state may be shared between event loops on different threads, the lock is never held across an await
+        self._lock = threading.Lock()
+        self._state = CircuitState.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> CircuitState:
+        return self._state
+
+    def allow(self) -> Permit:
+        """Returns whether a call to the provider is currently allowed and whether it is the half-open trial call."""
+        with self._lock:
+            if self._state == CircuitState.CLOSED:
+                return Permit.CALL
+
+            if self._state == CircuitState.OPEN:
+                if time.monotonic() - self._opened_at < self._recovery_seconds:
+                    return Permit.DENIED
+                logger.info(
+                    f"circuit for {self._name} is half-open, allowing a trial call"
+                )
+                self._state = CircuitState.HALF_OPEN
+                self._trial_in_flight = False
+
+            # HALF_OPEN: only a single trial call at a time
+            if self._trial_in_flight:
+                return Permit.DENIED
+            self._trial_in_flight = True
+            return Permit.TRIAL
+
+    def release_trial(self) -> None:
+        """Releases a trial call that ended without an outcome (e.g. cancelled), so that a new trial is allowed.
+
+        Must only be called by the holder of a `Permit.TRIAL`.
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        """Records a successful call and closes the circuit."""
+        with self._lock:
+            if self._state != CircuitState.CLOSED:
+                logger.info(f"circuit for {self._name} is closed again")
+            self._state = CircuitState.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        """Records a failed call and opens the circuit if the error threshold is reached."""
+        with self._lock:
+            self._failures += 1
+            if (
+                self._state == CircuitState.HALF_OPEN
+                or self._failures >= self._error_threshold
+            ):
+                if self._state != CircuitState.OPEN:
+                    logger.warning(
+                        f"circuit for {self._name} is open after {self._failures} consecutive failure(s)"
+                    )
+                self._state = CircuitState.OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
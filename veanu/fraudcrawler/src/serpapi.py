@@ -154,10 +154,9 @@ class SerpApiClient:
             Exception: If all API call attempts fail.
         """
 
-        attempts = 0
         max_retries = 5
         retry_delay = 5
-        while attempts < max_retries:
+        for attempt in range(max_retries):
             try:
                 search = GoogleSearch(params)
 
@@ -175,9 +174,11 @@ class SerpApiClient:
                     callback(1)
                 return response.json()
             except Exception as e:
+                if attempt == max_retries - 1:
+                    logger.error(f"API call failed with error: {e}.")
+                    break
                 logger.warning(
                     f"API call failed with error: {e}. Retrying in {retry_delay} seconds..."
                 )
-                attempts += 1
                 time.sleep(retry_delay)
         raise Exception("All API call attempts to SerpAPI failed.")
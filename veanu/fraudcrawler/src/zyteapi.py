@@ -1,13 +1,33 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
 import logging
-import requests
-from requests.auth import HTTPBasicAuth
-import time
+import random
+import sys
 from tqdm.auto import tqdm
-from typing import List
+from typing import Any, Callable, Coroutine, Dict, List
+
+import aiohttp
+from aiohttp.resolver import AsyncResolver
+import orjson
+
+from veanu.fraudcrawler.src.circuit_breaker import CircuitBreaker, Permit
+
+try:
+    import uvloop
+except ImportError:  # uvloop is not available on Windows
+    uvloop = None
 
 logger = logging.getLogger(__name__)
 
 
+def _run_in_new_loop(coro: Coroutine[Any, Any, Any]) -> Any:
+    """Runs a coroutine in a new event loop (using uvloop if available)."""
+    loop_factory = uvloop.new_event_loop if uvloop is not None else None
+    with asyncio.Runner(loop_factory=loop_factory) as runner:
+        return runner.run(coro)
+
+
 class ZyteAPIClient:
     """A client to interact with the Zyte API for fetching product details."""
 
@@ -23,13 +43,22 @@ class ZyteAPIClient:
         "actions": [],
         "product": True,
     }
+    # The serialized config without its closing brace, the URL is spliced in per request
+    _body_prefix = orjson.dumps(_config)[:-1] + b',"url":'
+    _headers = {"Content-Type": "application/json"}
     _requests_timeout = 10
+    _ttl_dns_cache = 3600
+    _total_timeout = 60
+    _retry_status_codes = (429, 500, 502, 503, 504, 520)
+    _retry_delay_cap = 60
+    _executor_parse_min_bytes = 256 * 1024
 
     def __init__(
         self,
         api_key: str,
         max_retries: int = 3,
         retry_delay: int = 5,
+        async_limit_per_host: int = 5,
     ):
         """Initializes the ZyteApiClient with the given API key and retry configurations.
 
@@ -37,73 +66,318 @@ class ZyteAPIClient:
             api_key: The API key for Zyte API.
             max_retries: Maximum number of retries for API calls (default: 3).
             retry_delay: Delay between retries in seconds (default: 5).
+            async_limit_per_host: Max number of simultaneous connections to the Zyte API (default: 5).
         """
-        self._basic_auth = HTTPBasicAuth(api_key, "")
+        self._aiohttp_auth = aiohttp.BasicAuth(api_key, "")
         self._max_retries = max_retries
         self._retry_delay = retry_delay
+        self._async_limit_per_host = async_limit_per_host
+        # Sessions and semaphores are bound to an event loop, hence they are kept per loop
+        self._sessions = {}  # type: Dict[asyncio.AbstractEventLoop, aiohttp.ClientSession]
+        self._sems = {}  # type: Dict[asyncio.AbstractEventLoop, asyncio.Semaphore]
+        self._breaker = CircuitBreaker(
+            name=self._endpoint, error_threshold=5, recovery_seconds=30
+        )
+
+    async def _ensure_session(self) -> aiohttp.ClientSession:
+        """Lazily creates the aiohttp session shared within the running event loop."""
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            # aiodns needs a SelectorEventLoop, the default ProactorEventLoop on Windows falls back to the threaded resolver
+            resolver = AsyncResolver() if sys.platform != "win32" else None
+            connector = aiohttp.TCPConnector(
+                limit=0,
+                limit_per_host=self._async_limit_per_host,
+                resolver=resolver,
+                use_dns_cache=True,
+                ttl_dns_cache=self._ttl_dns_cache,
+                keepalive_timeout=60,
+            )
+            session = aiohttp.ClientSession(
+                connector=connector,
+                auth=self._aiohttp_auth,
+                timeout=aiohttp.ClientTimeout(total=self._requests_timeout),
+            )
+            self._sessions[loop] = session
+        return session
+
+    def _bulkhead(self) -> asyncio.Semaphore:
+        """Returns the semaphore bounding the in-flight requests (independently of the number of workers) within the
+        running event loop."""
+        loop = asyncio.get_running_loop()
+        sem = self._sems.get(loop)
+        if sem is None:
+            sem = asyncio.Semaphore(self._async_limit_per_host)
+            self._sems[loop] = sem
+        return sem
+
+    async def close(self) -> None:
+        """Closes the aiohttp session of the running event loop (sessions of other loops are left untouched)."""
+        loop = asyncio.get_running_loop()
+        session = self._sessions.pop(loop, None)
+        self._sems.pop(loop, None)
+        if session is not None and not session.closed:
+            await session.close()
+
+    def _backoff_delay(self, attempt: int, retry_after: str | None = None) -> float:
+        """Computes the delay before the next retry by exponential backoff with full jitter.
+
+        Args:
+            attempt: The zero-based index of the attempt that just failed.
+            retry_after: The value of the `Retry-After` response header (if any), used as lower bound.
+        """
+        delay = random.uniform(  # nosec
+            0, min(self._retry_delay_cap, self._retry_delay * (2**attempt))
+        )
+        if retry_after is not None:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                logger.debug(f"ignoring non-numeric Retry-After header {retry_after}")
+        return delay
 
     def get_details(self, urls: List[str], product: bool = True) -> List[dict]:
         """Fetches product details from the given URLs using Zyte API.
 
+        The URLs are fetched concurrently by the async pipeline (see :meth:`fetch_all`). Duplicate URLs are fetched
+        only once and their product details are returned for each occurrence. Repeated occurrences get a deep copy,
+        so every returned dict can be modified in place independently.
+
         Args:
             urls: A list of URLs to fetch product details from.
             product: Whether to extract product details (default: True).
         """
+        unique = list(dict.fromkeys(urls))
         logger.info(
-            f"fetching product details for {len(urls)} URLs via Zyte API (synchronous)"
+            f"fetching product details for {len(unique)} unique URLs (out of {len(urls)}) via Zyte API"
         )
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            results = _run_in_new_loop(self._gather(urls=unique))
+        else:
+            # Called from within an event loop: run the pipeline on a dedicated thread's loop
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                results = executor.submit(
+                    _run_in_new_loop, self._gather(urls=unique)
+                ).result()
 
+        # Fan the results back out to the original (possibly duplicated) URLs
+        by_url = {prod["url"]: prod for prod in results}
         products = []
-        with tqdm(total=len(urls)) as pbar:
-            for url in urls:
-                attempts = 0
-                while attempts < self._max_retries:
-                    try:
-                        logger.debug(
-                            f"fetch product details for URL {url} (Attempt {attempts + 1})"
-                        )
+        seen = set()
+        for url in urls:
+            if url not in by_url:
+                continue
+            if url in seen:
+                products.append(deepcopy(by_url[url]))
+            else:
+                seen.add(url)
+                products.append(by_url[url])
+        logger.info(f"fetched product details for {len(products)} URLs")
+        return products
+
+    async def _gather(self, urls: List[str]) -> List[dict]:
+        """Fetches the product details of all URLs by :meth:`fetch_all` and closes the session afterwards.
+
+        Args:
+            urls: A list of URLs to fetch product details from.
+        """
+        try:
+            # Throttle the terminal writes of the progress bar for large batches
+            with tqdm(
+                total=len(urls), mininterval=0.5, miniters=max(1, len(urls) // 100)
+            ) as pbar:
+                products = await self.fetch_all(urls=urls, callback=pbar.update)
+        finally:
+            # Only closes the session of this call's event loop
+            await self.close()
+        return [prod for prod in products if prod is not None]
+
+    async def fetch_all(
+        self, urls: List[str], callback: Callable[[int], None] | None = None
+    ) -> List[dict | None]:
+        """Fetches the product details of a known list of URLs concurrently.
+
+        The number of simultaneous requests is bounded by the bulkhead only, no slot is held during backoff sleeps.
+        Note that the deadline of every URL starts with this call, for very long lists consider feeding the queue
+        based :meth:`async_get_details` instead (which is also the choice for streaming producers).
+
+        Args:
+            urls: A list of URLs to fetch product details from.
+            callback: Called with 1 after each processed URL, e.g. for progress reporting (default: None).
 
-                        response = requests.post(
-                            self._endpoint,
-                            auth=self._basic_auth,
-                            json={
-                                "url": url,
-                                **self._config,
-                            },
-                            timeout=self._requests_timeout,
+        Returns:
+            The product details in the order of `urls` (`None` for URLs that failed).
+        """
+
+        async def one(url: str) -> dict | None:
+            product = await self._async_get_details_for_url(url=url)
+            if callback is not None:
+                callback(1)
+            return product
+
+        results = await asyncio.gather(*map(one, urls), return_exceptions=True)
+
+        products = []
+        for url, res in zip(urls, results):
+            if isinstance(res, BaseException):
+                logger.error(
+                    f"exception occurred while fetching product details for URL {url}: {res}"
+                )
+                res = None
+            products.append(res)
+        return products
+
+    async def _aiohttp_post(
+        self, url: str, timeout: aiohttp.ClientTimeout | None = None
+    ) -> dict:
+        """Fetches the product details of a single URL by an aiohttp POST request to the Zyte API.
+
+        Args:
+            url: The URL to fetch product details from.
+            timeout: Overrides the session timeout for this request (default: None).
+        """
+        session = await self._ensure_session()
+        body = self._body_prefix + orjson.dumps(url) + b"}"
+        if timeout is None:
+            timeout = session.timeout
+        async with session.post(
+            self._endpoint, data=body, headers=self._headers, timeout=timeout
+        ) as response:
+            response.raise_for_status()
+            # Decode the raw bytes directly (the body contains the base64-encoded page and can be large)
+            raw = await response.read()
+
+        # Parse large bodies in a worker thread so that the event loop keeps serving the other requests
+        if len(raw) >= self._executor_parse_min_bytes:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, orjson.loads, raw)
+        return orjson.loads(raw)
+
+    async def _async_get_details_for_url(self, url: str) -> dict | None:
+        """Fetches the product details of a single URL with retries, all within an end-to-end deadline of
+        `_total_timeout` seconds (including the waits for a free slot of the bulkhead).
+
+        Args:
+            url: The URL to fetch product details from.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self._total_timeout
+        sem = self._bulkhead()
+        for attempt in range(self._max_retries):
+            # Waiting for a free slot of the bulkhead counts against the deadline
+            try:
+                async with asyncio.timeout(deadline - loop.time()):
+                    await sem.acquire()
+            except TimeoutError:
+                logger.error(
+                    f"deadline exceeded while waiting for a free slot for URL: {url}"
+                )
+                return None
+
+            # The slot is released before any backoff sleep
+            try:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    logger.error(f"deadline exceeded for URL: {url}")
+                    return None
+                permit = self._breaker.allow()
+                if not permit:
+                    logger.error(f"circuit for Zyte API is open, skipping URL {url}")
+                    return None
+
+                retry_after = None
+                try:
+                    logger.debug(
+                        f"fetch product details for URL {url} (Attempt {attempt + 1})"
+                    )
+                    timeout = aiohttp.ClientTimeout(
+                        total=max(0.1, min(self._requests_timeout, remaining))
+                    )
+                    product = await self._aiohttp_post(url=url, timeout=timeout)
+                    if not isinstance(product, dict):
+                        raise ValueError(
+                            f"unexpected response of type {type(product).__name__}"
                         )
-                        if response.status_code == 200:
-                            product_data = response.json()
-                            product_data["url"] = url  # Ensure the URL is included
-                            products.append(product_data)
-                            logger.debug(
-                                f"successfully fetched product details for URL {url}"
-                            )
-                            break
-                        else:
-                            logger.error(
-                                f"Zyte API request failed for URL {url} with status code {response.status_code} "
-                                f"and response: {response.text}"
-                            )
-                            attempts += 1
-                            if attempts < self._max_retries:
-                                logger.warning(
-                                    f"retrying in {self._retry_delay} seconds..."
-                                )
-                                time.sleep(self._retry_delay)
-                    except Exception as e:
+                    product["url"] = url  # Ensure the URL is included
+                    self._breaker.record_success()
+                    logger.debug(f"successfully fetched product details for URL {url}")
+                    return product
+                except aiohttp.ClientResponseError as e:
+                    if e.headers is not None:
+                        retry_after = e.headers.get("Retry-After")
+                    if e.status not in self._retry_status_codes:
+                        # The API is reachable, the request itself is invalid
+                        self._breaker.record_success()
                         logger.error(
-                            f"exception occurred while fetching product details for URL {url}: {e}"
+                            f"Zyte API request failed for URL {url} with non-retryable status code {e.status}: {e.message}"
                         )
-                        attempts += 1
-                        if attempts < self._max_retries:
-                            logger.warning(
-                                f"retrying in {self._retry_delay} seconds..."
-                            )
-                            time.sleep(self._retry_delay)
-                else:
-                    logger.error(f"all attempts failed for URL: {url}")
-                pbar.update(1)
+                        return None
+                    logger.error(
+                        f"Zyte API request failed for URL {url} with status code {e.status}: {e.message}"
+                    )
+                    self._breaker.record_failure()
+                except (asyncio.TimeoutError, aiohttp.ClientConnectionError) as e:
+                    logger.error(
+                        f"transient error occurred while fetching product details for URL {url}: {e!r}"
+                    )
+                    self._breaker.record_failure()
+                except Exception as e:
+                    logger.error(
+                        f"exception occurred while fetching product details for URL {url}: {e}"
+                    )
+                    self._breaker.record_failure()
+                    return None
+                except BaseException:
+                    # E.g. cancellation: no outcome to record, but a half-open trial must not stay in flight
+                    if permit is Permit.TRIAL:
+                        self._breaker.release_trial()
+                    raise
+            finally:
+                sem.release()
 
-        logger.info(f"fetched product details for {len(products)} URLs")
-        return products
+            if attempt < self._max_retries - 1:
+                delay = self._backoff_delay(attempt=attempt, retry_after=retry_after)
+                if loop.time() + delay >= deadline:
+                    logger.error(f"deadline exceeded for URL: {url}")
+                    return None
+                logger.warning(f"retrying in {delay:.2f} seconds...")
+                await asyncio.sleep(delay)
+        logger.error(f"all attempts failed for URL: {url}")
+        return None
+
+    async def async_get_details(
+        self,
+        queue_in: asyncio.Queue,
+        queue_out: asyncio.Queue,
+        callback: Callable[[int], None] | None = None,
+    ) -> None:
+        """Pops a URL (str) from the input queue, fetches its product details, and puts them in the output queue
+        until a `None` sentinel is received.
+
+        Args:
+            queue_in: The input queue containing the URLs.
+            queue_out: The output queue for the product details.
+            callback: Called with 1 after each processed URL, e.g. for progress reporting (default: None).
+        """
+        while True:
+            # Get URL from input queue
+            url = await queue_in.get()
+
+            # Check stopping condition
+            if url is None:
+                queue_in.task_done()
+                break
+
+            # Fetch the product details and put them in the output queue
+            product = await self._async_get_details_for_url(url=url)
+            if product is not None:
+                await queue_out.put(product)
+            if callback is not None:
+                callback(1)
+            queue_in.task_done()
+
+            # Yield to the event loop, awaiting ready futures does not force a context switch
+            await asyncio.sleep(0)